@@ -1,18 +1,25 @@
 # tony_bot_final.py
 import os
+import sys
+import json
+import time
 import logging
 import random
 import asyncio
 import re
-from typing import Optional, Dict, List, Set, Any
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from itertools import islice
+from typing import Optional, Dict, List, Set, Any, Awaitable, Callable
 
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 import aiohttp
 import aiosqlite
+import orjson
 
 # -------------------------
 # CONFIG
@@ -25,7 +32,7 @@ if not TOKEN or not OWNER_ID:
 OWNER_ID = int(OWNER_ID)
 
 # Counting channels (IDs you use)
-COUNTING_CHANNEL_IDS = [1398545401598050425, 1411772929720586401]
+COUNTING_CHANNEL_IDS = frozenset({1398545401598050425, 1411772929720586401})
 FAILURE_ROLE_ID = 1210840031023988776
 
 # Role required to manage giveaways (users must have this role in that server)
@@ -47,9 +54,31 @@ FOOTER_TEXT = f"Join my Roblox group ➜ {ROBLOX_GROUP_URL}"
 
 DB_PATH = "bot_data.db"
 
+# counting statements; identical text lets sqlite3's per-connection statement cache reuse the prepared form
+SQL_COUNTING_SEED = "INSERT OR IGNORE INTO counting (channel_id, last_number) VALUES (?, 0)"
+SQL_COUNTING_LOAD = "SELECT channel_id, last_number FROM counting"
+SQL_COUNTING_UPDATE = "UPDATE counting SET last_number = ? WHERE channel_id = ?"
+
+# queued INSERTs (table -> statement) flushed in batches by TonyBot._flush_loop
+WRITE_SQL: Dict[str, str] = {
+    "reports": "INSERT INTO reports (user_id, username, content) VALUES (?, ?, ?)",
+    "suggestions": "INSERT INTO suggestions (user_id, username, content) VALUES (?, ?, ?)",
+    "giveaway_participants": "INSERT OR IGNORE INTO giveaway_participants (message_id, user_id) VALUES (?, ?)",
+}
+WRITE_BATCH_MAX = 64
+WRITE_BATCH_WINDOW = 0.5
+# poller ticks (5s each) a due giveaway may fail to end before it's closed without a draw
+GIVEAWAY_END_MAX_ATTEMPTS = 60
+
 # Easter egg gif for 67
 EASTER_EGG_67_GIF = "https://tenor.com/view/67-gif-8575841764206736991"
 
+# reaction emojis, parsed once instead of on every add_reaction call
+CHECK_EMOJI = discord.PartialEmoji.from_str("✅")
+CROSS_EMOJI = discord.PartialEmoji.from_str("❌")
+# reactions added when the bot is mentioned ("YES?")
+MENTION_EMOJIS = tuple(discord.PartialEmoji.from_str(e) for e in ("🇾", "🇪", "🇸", "❓"))
+
 # -------------------------
 # LOGGING & INTENTS
 # -------------------------
@@ -62,6 +91,63 @@ intents.members = True
 intents.messages = True
 intents.message_content = True
 
+# -------------------------
+# DATABASE
+# -------------------------
+class SQLitePool:
+    """
+    Small fixed-size pool of aiosqlite connections so one slow commit
+    doesn't stall every other query behind aiosqlite's per-connection thread.
+    """
+    def __init__(self, path: str, size: int = 4):
+        self.path = path
+        self.size = size
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._conns: List[aiosqlite.Connection] = []
+
+    async def _connect(self) -> aiosqlite.Connection:
+        # autocommit: single statements commit on their own, batches open an explicit BEGIN
+        conn = await aiosqlite.connect(self.path, isolation_level=None)
+        conn.row_factory = aiosqlite.Row
+        # WAL + NORMAL sync: commits become appends instead of full journal fsyncs
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA temp_store=MEMORY")
+        await conn.execute("PRAGMA cache_size=-20000")
+        await conn.execute("PRAGMA mmap_size=268435456")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    async def open(self):
+        for _ in range(self.size):
+            conn = await self._connect()
+            self._conns.append(conn)
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self._idle.get()
+        try:
+            yield conn
+        except BaseException:
+            # never hand a half-finished transaction to the next borrower
+            if conn.in_transaction:
+                try:
+                    await conn.rollback()
+                except Exception:
+                    logger.exception("Rollback failed")
+            raise
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._conns:
+            try:
+                await conn.close()
+            except Exception:
+                logger.exception("Failed to close DB connection")
+        self._conns.clear()
+
 # -------------------------
 # BOT CLASS
 # -------------------------
@@ -69,23 +155,49 @@ class TonyBot(commands.Bot):
     def __init__(self):
         super().__init__(command_prefix="/", intents=intents)
         self.session: Optional[aiohttp.ClientSession] = None
-        self.db: Optional[aiosqlite.Connection] = None
+        self.pool: Optional[SQLitePool] = None
         # runtime giveaways store: message_id -> giveaway data
         self.giveaways: Dict[int, dict] = {}
+        # message_id -> failed auto-end attempts (giveaway_poller retries up to GIVEAWAY_END_MAX_ATTEMPTS)
+        self._gw_end_attempts: Dict[int, int] = {}
+        # True while a giveaway_poller tick is running (close() lets it finish)
+        self._gw_polling = False
         # locks per counting channel to prevent race conditions
         self.count_locks: Dict[int, asyncio.Lock] = {}
-        # guard for creating locks
-        self._locks_registry_lock = asyncio.Lock()
         # pending bot prompts per channel (in-memory)
-        # channel_id -> {"prompt_num": int, "msg_id": int, "ts": datetime}
+        # channel_id -> {"prompt_num": int, "msg_id": int}; valid until the counter moves past it
         self.pending_prompts: Dict[int, Dict[str, Any]] = {}
+        # authoritative counting state (channel_id -> last_number); SQLite is a write-behind snapshot
+        self.last_number: Dict[int, int] = {}
+        self._counting_dirty: Set[int] = set()
+        # batched INSERTs: (table, params) drained by _flush_loop; None tells it to stop
+        self.write_queue: asyncio.Queue = asyncio.Queue()
+        self._writer_task: Optional[asyncio.Task] = None
+        # roblox lookups: lowercase username -> (fetched_at, user dict)
+        self._roblox_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # caps concurrent Roblox requests so bursts don't trip 429s
+        self._roblox_sem = asyncio.Semaphore(8)
+        # owner User for report/suggest DMs, fetched once (see dm_owner)
+        self.owner_user: Optional[discord.User] = None
+        # ids of recently handled counting messages, oldest first (drops replayed events)
+        self.recent_msg_ids: "OrderedDict[int, None]" = OrderedDict()
 
     async def setup_hook(self):
         # create session & DB, ensure tables, register commands
-        self.session = aiohttp.ClientSession()
-        self.db = await aiosqlite.connect(DB_PATH)
-        self.db.row_factory = aiosqlite.Row
+        connector = aiohttp.TCPConnector(limit=32, ttl_dns_cache=300, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=8))
+        self.pool = SQLitePool(DB_PATH)
+        await self.pool.open()
         await self._ensure_tables()
+        await self._load_counting()
+        await self._load_giveaways()
+        self.counting_flusher.start()
+        self.giveaway_poller.start()
+        self._writer_task = asyncio.create_task(self._flush_loop())
+        try:
+            self.owner_user = await self.fetch_user(OWNER_ID)
+        except Exception:
+            logger.exception("Failed to fetch owner user; will retry on first DM")
 
         # register giveaway group before syncing
         self.tree.add_command(giveaway_group)
@@ -95,37 +207,254 @@ class TonyBot(commands.Bot):
         logger.info("Slash commands synced (global)")
 
     async def _ensure_tables(self):
-        await self.db.execute("""
-            CREATE TABLE IF NOT EXISTS suggestions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                content TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        await self.db.execute("""
-            CREATE TABLE IF NOT EXISTS reports (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT,
-                content TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        await self.db.execute("""
-            CREATE TABLE IF NOT EXISTS counting (
-                channel_id INTEGER PRIMARY KEY,
-                last_number INTEGER DEFAULT 0
-            )
-        """)
-        await self.db.commit()
+        async with self.pool.connection() as db:
+            await db.execute("BEGIN")
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS suggestions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    username TEXT,
+                    content TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS reports (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    username TEXT,
+                    content TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS counting (
+                    channel_id INTEGER PRIMARY KEY,
+                    last_number INTEGER DEFAULT 0
+                )
+            """)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS giveaways (
+                    message_id INTEGER PRIMARY KEY,
+                    channel_id INTEGER,
+                    host_id INTEGER,
+                    prize TEXT,
+                    winners INTEGER,
+                    ends_at INTEGER,
+                    ended INTEGER DEFAULT 0,
+                    extra_roles_json TEXT,
+                    required_role_id INTEGER
+                )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_giveaways_due ON giveaways (ended, ends_at)")
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS giveaway_participants (
+                    message_id INTEGER,
+                    user_id INTEGER,
+                    PRIMARY KEY (message_id, user_id)
+                )
+            """)
+            # seed counting rows once so the message hot path never has to INSERT
+            await db.executemany(SQL_COUNTING_SEED, [(cid,) for cid in COUNTING_CHANNEL_IDS])
+            await db.commit()
+
+    async def _load_counting(self):
+        async with self.pool.connection() as db:
+            async with db.execute(SQL_COUNTING_LOAD) as cur:
+                for row in await cur.fetchall():
+                    self.last_number[int(row["channel_id"])] = int(row["last_number"] or 0)
+
+    async def _load_giveaways(self):
+        # restore open giveaways and re-attach their buttons; giveaway_poller ends them when due
+        async with self.pool.connection() as db:
+            async with db.execute("SELECT * FROM giveaways WHERE ended = 0") as cur:
+                rows = await cur.fetchall()
+            async with db.execute(
+                "SELECT p.message_id, p.user_id FROM giveaway_participants p "
+                "JOIN giveaways g ON g.message_id = p.message_id WHERE g.ended = 0 ORDER BY p.rowid"
+            ) as cur:
+                participant_rows = await cur.fetchall()
+        participants: Dict[int, Dict[int, None]] = {}
+        for row in participant_rows:
+            participants.setdefault(int(row["message_id"]), {})[int(row["user_id"])] = None
+        for row in rows:
+            mid = int(row["message_id"])
+            gw_extra = {int(k): v for k, v in json.loads(row["extra_roles_json"] or "{}").items()}
+            self.giveaways[mid] = {
+                "prize": row["prize"],
+                "channel_id": row["channel_id"],
+                "host_id": row["host_id"],
+                "required_role_id": row["required_role_id"],
+                "extra_roles": gw_extra,
+                "bonuses": merge_bonuses(gw_extra),
+                "winners": int(row["winners"]),
+                "ends_at": int(row["ends_at"]),
+                "participants": participants.get(mid, {}),
+                "message": None,
+                "ended": False,
+            }
+            self.add_view(ParticipantsView(message_id=mid, initial_count=len(participants.get(mid, ()))), message_id=mid)
+        if rows:
+            logger.info("Restored %s open giveaway(s)", len(rows))
+
+    @tasks.loop(seconds=5)
+    async def giveaway_poller(self):
+        # one timer for every giveaway instead of a sleeping task per giveaway
+        self._gw_polling = True
+        try:
+            await self._end_due_giveaways()
+        finally:
+            self._gw_polling = False
+
+    async def _end_due_giveaways(self):
+        now = int(time.time())
+        due: Dict[int, int] = {}
+        try:
+            async with self.pool.connection() as db:
+                async with db.execute("SELECT message_id, channel_id FROM giveaways WHERE ended = 0 AND ends_at <= ?", (now,)) as cur:
+                    for row in await cur.fetchall():
+                        due[int(row["message_id"])] = row["channel_id"]
+        except Exception:
+            logger.exception("Failed to query due giveaways")
+        # giveaways whose INSERT failed only exist in memory
+        for mid, gw in self.giveaways.items():
+            if not gw.get("ended") and gw["ends_at"] <= now:
+                due.setdefault(mid, gw["channel_id"])
+        for mid, channel_id in due.items():
+            try:
+                chan = self.get_channel(channel_id) or await self.fetch_channel(channel_id)
+                await end_giveaway(chan, mid)
+            except Exception:
+                logger.exception("Auto-end failed for giveaway %s", mid)
+            gw = self.giveaways.get(mid)
+            if gw is None or gw.get("ended"):
+                self._gw_end_attempts.pop(mid, None)
+                continue
+            # still open: leave it for the next tick unless it keeps failing
+            attempts = self._gw_end_attempts.get(mid, 0) + 1
+            if attempts < GIVEAWAY_END_MAX_ATTEMPTS:
+                self._gw_end_attempts[mid] = attempts
+                continue
+            logger.error("Giving up on ending giveaway %s after %s attempts", mid, attempts)
+            self._gw_end_attempts.pop(mid, None)
+            await mark_giveaway_ended(mid)
+
+    @giveaway_poller.before_loop
+    async def _before_giveaway_poller(self):
+        await self.wait_until_ready()
+
+    async def flush_counting(self):
+        # write every dirty channel in one batched transaction
+        if not self._counting_dirty:
+            return
+        dirty = self._counting_dirty
+        self._counting_dirty = set()
+        rows = [(self.last_number.get(cid, 0), cid) for cid in dirty]
+        try:
+            async with self.pool.connection() as db:
+                # take the write lock up front so the whole batch lands in one transaction
+                await db.execute("BEGIN IMMEDIATE")
+                await db.executemany(SQL_COUNTING_UPDATE, rows)
+                await db.commit()
+        except Exception:
+            logger.exception("Failed to flush counting state")
+            self._counting_dirty |= dirty
+        except BaseException:
+            # cancelled mid-flush: keep the channels dirty for the next (or final) flush
+            self._counting_dirty |= dirty
+            raise
+
+    @tasks.loop(seconds=5)
+    async def counting_flusher(self):
+        await self.flush_counting()
+
+    async def _write_batch(self, items: List[tuple]):
+        # group by table so each gets a single executemany, then commit once
+        grouped: Dict[str, List[tuple]] = {}
+        for table, params in items:
+            grouped.setdefault(table, []).append(params)
+        try:
+            async with self.pool.connection() as db:
+                await db.execute("BEGIN IMMEDIATE")
+                for table, rows in grouped.items():
+                    await db.executemany(WRITE_SQL[table], rows)
+                await db.commit()
+        except Exception:
+            logger.exception("Failed to write %s queued rows", len(items))
+
+    def _drain_write_queue(self, limit: Optional[int] = None) -> List[tuple]:
+        items = []
+        while not self.write_queue.empty() and (limit is None or len(items) < limit):
+            items.append(self.write_queue.get_nowait())
+        return items
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            # wait for the first row, then keep collecting until the batch is full or the window closes
+            item = await self.write_queue.get()
+            if item is None:
+                return
+            items = [item]
+            deadline = loop.time() + WRITE_BATCH_WINDOW
+            while len(items) < WRITE_BATCH_MAX:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.write_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    # close() asked us to stop: write what we hold, then exit
+                    stopping = True
+                    break
+                items.append(item)
+            await self._write_batch(items)
+
+    async def dm_owner(self, embed: discord.Embed):
+        """
+        DM the owner using the cached User; re-fetch once if it's missing or went stale
+        """
+        for _ in range(2):
+            if self.owner_user is None:
+                self.owner_user = await self.fetch_user(OWNER_ID)
+            try:
+                await self.owner_user.send(embed=embed)
+                return
+            except discord.NotFound:
+                self.owner_user = None
+        raise RuntimeError("owner user not found")
 
     async def close(self):
+        if self.counting_flusher.is_running():
+            self.counting_flusher.cancel()
+            # let a cancelled in-flight flush restore its dirty set before the final flush below
+            if task := self.counting_flusher.get_task():
+                await asyncio.gather(task, return_exceptions=True)
+        if self.giveaway_poller.is_running():
+            # a tick mid-draw must finish: cancelling between the winners edit and
+            # mark_giveaway_ended would leave the row open and redraw it after restart
+            if self._gw_polling:
+                self.giveaway_poller.stop()
+            else:
+                # idle in its sleep; stop() would wait it out and run one more tick
+                self.giveaway_poller.cancel()
+            if task := self.giveaway_poller.get_task():
+                await asyncio.gather(task, return_exceptions=True)
+        if self._writer_task:
+            # sentinel instead of cancel() so rows already taken off the queue still get written
+            self.write_queue.put_nowait(None)
+            await asyncio.gather(self._writer_task, return_exceptions=True)
+        if self.pool:
+            await self.flush_counting()
+            if pending := self._drain_write_queue():
+                await self._write_batch(pending)
         if self.session:
             await self.session.close()
-        if self.db:
-            await self.db.close()
+        if self.pool:
+            await self.pool.close()
         await super().close()
 
 bot = TonyBot()
@@ -133,72 +462,146 @@ bot = TonyBot()
 # -------------------------
 # HELPERS
 # -------------------------
+def member_has_role(member: discord.Member, role_id: int) -> bool:
+    # Member._roles is a sorted SnowflakeList of ids: binary search, no Role objects built
+    return member._roles.has(role_id)
+
 def member_has_giveaway_role(member: discord.Member) -> bool:
-    return any(r.id == GIVEAWAY_HOST_ROLE_ID for r in member.roles)
+    return member_has_role(member, GIVEAWAY_HOST_ROLE_ID)
+
+DURATION_RE = re.compile(r'^\s*(?:(?P<days>\d+)\s*d)?\s*(?:(?P<hours>\d+)\s*h)?\s*(?:(?P<minutes>\d+)\s*m)?\s*(?:(?P<seconds>\d+)\s*s)?\s*$')
+
+DURATION_UNITS = {"d": 86400, "h": 3600, "m": 60, "s": 1}
 
 def parse_duration_to_seconds(s: str) -> Optional[int]:
     s = (s or "").strip().lower()
     if not s:
         return None
-    if s.isdigit():
+    # isdecimal, not isdigit: "²" passes isdigit but int() rejects it
+    if s.isdecimal():
         sec = int(s)
         return sec if sec > 0 else None
-    pattern = r'^\s*(?:(?P<days>\d+)\s*d)?\s*(?:(?P<hours>\d+)\s*h)?\s*(?:(?P<minutes>\d+)\s*m)?\s*(?:(?P<seconds>\d+)\s*s)?\s*$'
-    m = re.fullmatch(pattern, s)
+    # fast path for the common single-unit form ("45m", "2h") without the regex
+    if s[-1] in DURATION_UNITS and s[:-1].isdecimal():
+        sec = int(s[:-1]) * DURATION_UNITS[s[-1]]
+        return sec if sec > 0 else None
+    m = DURATION_RE.fullmatch(s)
     if not m:
         return None
     parts = {k: int(v) for k, v in m.groupdict().items() if v}
     seconds = parts.get("days", 0) * 86400 + parts.get("hours", 0) * 3600 + parts.get("minutes", 0) * 60 + parts.get("seconds", 0)
     return seconds if seconds > 0 else None
 
-async def fetch_reaction_users(reaction: discord.Reaction) -> List[discord.User]:
-    users = []
-    async for u in reaction.users():
-        users.append(u)
-    return users
+async def resolve_missing_members(guild: discord.Guild, uids) -> None:
+    """
+    Batch-fetch members missing from the cache so get_member() finds them
+    (one gateway query per 100 ids instead of dropping them or fetching one by one)
+    """
+    missing = [uid for uid in uids if guild.get_member(uid) is None]
+    for i in range(0, len(missing), 100):
+        batch = missing[i:i + 100]
+        try:
+            await guild.query_members(user_ids=batch, limit=len(batch), cache=True)
+        except Exception:
+            logger.exception("Failed to query %s missing members", len(batch))
+
+EXTRA_ENTRY_RE = re.compile(r"(?:<@&)?(\d+)>?\s*:\s*(\d+)")
 
 def parse_extra_entries_string(s: Optional[str]) -> Dict[int, int]:
     """
     Parse "roleid:bonus,roleid:bonus" or "<@&id>:bonus"
     """
-    parsed: Dict[int, int] = {}
-    if not s:
-        return parsed
-    parts = [p.strip() for p in s.split(",") if p.strip()]
-    for p in parts:
-        cleaned = p.replace("<@&", "").replace(">", "").strip()
-        if ":" in cleaned:
-            left, right = cleaned.split(":", 1)
-            try:
-                rid = int(left.strip())
-                bonus = int(right.strip())
-                if bonus > 0:
-                    parsed[rid] = bonus
-            except Exception:
-                logger.warning("Couldn't parse extra entry part: %s", p)
-    return parsed
+    # one regex scan, no split/replace per part
+    return {
+        int(rid): int(bonus)
+        for rid, bonus in EXTRA_ENTRY_RE.findall(s or "")
+        if int(bonus) > 0
+    }
+
+# the global part of the "Extra Entries" field never changes, so render it once
+BONUS_ROLES_TEXT = "\n".join(f"<@&{rid}>: +{bonus}" for rid, bonus in BONUS_ROLES.items())
 
-def calculate_entries_for_member(member: discord.Member, gw_extra: Dict[int, int]) -> int:
+def extra_entries_field_text(gw_extra: Dict[int, int]) -> str:
     """
-    Base 1 entry + bonuses from global BONUS_ROLES and gw_extra
+    Global BONUS_ROLES lines, with per-giveaway extras overriding/appending
     """
-    entries = 1
-    # global bonuses
-    for rid, bonus in BONUS_ROLES.items():
-        if discord.utils.get(member.roles, id=rid):
-            entries += bonus
-    # giveaway-specific bonuses
+    if not gw_extra:
+        return BONUS_ROLES_TEXT or "None"
+    merged = {**BONUS_ROLES, **gw_extra}
+    return "\n".join(f"<@&{rid}>: +{bonus}" for rid, bonus in merged.items())
+
+def merge_bonuses(gw_extra: Dict[int, int]) -> Dict[int, int]:
+    """
+    Global BONUS_ROLES plus giveaway-specific extras in one map (bonuses add up)
+    """
+    merged = dict(BONUS_ROLES)
     for rid, bonus in gw_extra.items():
-        if discord.utils.get(member.roles, id=rid):
-            entries += bonus
+        merged[rid] = merged.get(rid, 0) + bonus
+    return merged
+
+def calculate_entries_for_member(member: discord.Member, bonuses: Dict[int, int], role_ids: Optional[Set[int]] = None) -> int:
+    """
+    Base 1 entry + bonuses from the merged bonus map (see merge_bonuses)
+    (pass role_ids if the caller already built the member's role id set)
+    """
+    rids = role_ids if role_ids is not None else set(member._roles)
+    # C-level set intersection, then sum only the matching bonuses
+    entries = 1 + sum(bonuses[rid] for rid in rids & bonuses.keys())
     return max(1, entries)
 
+def cached_entries(gw: dict, member: discord.Member) -> int:
+    """
+    Entries for a member in this giveaway, computed once and cached in gw["entries"]
+    (on_member_update drops the cached value when the member's roles change)
+    """
+    entries_map: Dict[int, int] = gw.setdefault("entries", {})
+    entries = entries_map.get(member.id)
+    if entries is None:
+        bonuses = gw.get("bonuses") or merge_bonuses(gw.get("extra_roles") or {})
+        entries = entries_map[member.id] = calculate_entries_for_member(member, bonuses)
+    return entries
+
+def pick_weighted_winners(eligible_list: List[tuple], count: int) -> List[int]:
+    """
+    Draw up to `count` distinct user ids from (uid, entries) pairs, weighted by entries
+    """
+    uids = [uid for uid, _ in eligible_list]
+    weights = [entries for _, entries in eligible_list]
+    remaining = sum(weights)
+    winners_ids = []
+    for _ in range(min(count, len(uids))):
+        if remaining <= 0:
+            break
+        idx = random.choices(range(len(uids)), weights=weights, k=1)[0]
+        winners_ids.append(uids[idx])
+        # zero the winner's weight so it can't be drawn again (no list rebuild)
+        remaining -= weights[idx]
+        weights[idx] = 0
+    return winners_ids
+
 # -------------------------
 # UI: Join button + Participants dropdown (button-only joins)
 # -------------------------
+LABEL_UPDATE_INTERVAL = 2  # seconds between join-count edits per giveaway message
+
+async def join_label_updater(gw: dict, button: "JoinButton", message: discord.Message):
+    """
+    Push the latest join count to the button at most once per LABEL_UPDATE_INTERVAL;
+    exits once no join arrived during the last interval (JoinButton restarts it)
+    """
+    while True:
+        await asyncio.sleep(LABEL_UPDATE_INTERVAL)
+        if gw.get("ended") or not gw.pop("_dirty", False):
+            return
+        button.label = f"🎉 Join Giveaway ({len(gw.get('participants') or ())} joined)"
+        try:
+            await message.edit(view=button.view)
+        except Exception:
+            logger.exception("Failed to update join button label")
+
 class JoinButton(discord.ui.Button):
     def __init__(self, message_id: int, initial_count: int = 0):
-        super().__init__(style=discord.ButtonStyle.success, label=f"🎉 Join Giveaway ({initial_count} joined)")
+        super().__init__(style=discord.ButtonStyle.success, label=f"🎉 Join Giveaway ({initial_count} joined)", custom_id="giveaway:join")
         self.message_id = message_id
 
     async def callback(self, interaction: discord.Interaction):
@@ -210,31 +613,35 @@ class JoinButton(discord.ui.Button):
 
             uid = interaction.user.id
 
+            member = interaction.user if isinstance(interaction.user, discord.Member) else None
+
             # required role check
             req = gw.get("required_role_id")
             if req:
-                member = interaction.guild.get_member(uid) if interaction.guild else None
-                if not member or not discord.utils.get(member.roles, id=req):
+                if not member or not member_has_role(member, req):
                     await interaction.response.send_message("You're missing the required role to join.", ephemeral=True)
                     return
 
-            participants: Set[int] = gw.setdefault("participants", set())
+            participants: Dict[int, None] = gw.setdefault("participants", {})
             if uid in participants:
                 await interaction.response.send_message("You're already entered!", ephemeral=True)
                 return
 
-            participants.add(uid)
-            gw["participants"] = participants
+            participants[uid] = None
+            # compute entries once at join time; end/reroll/view read the cache
+            if member:
+                cached_entries(gw, member)
 
-            # update button label live
-            try:
-                self.label = f"🎉 Join Giveaway ({len(participants)} joined)"
-                if interaction.message:
-                    await interaction.message.edit(view=self.view)
-            except Exception:
-                logger.exception("Failed to update join button label")
+            # coalesce label edits: mark dirty, one updater task per giveaway does the edit
+            gw["_dirty"] = True
+            task = gw.get("_label_task")
+            if interaction.message and (task is None or task.done()):
+                gw["_label_task"] = asyncio.create_task(join_label_updater(gw, self, interaction.message))
 
             await interaction.response.send_message("✅ You've been entered into the giveaway!", ephemeral=True)
+
+            # persist via the batched write queue so join bursts share one commit
+            bot.write_queue.put_nowait(("giveaway_participants", (self.message_id, uid)))
         except Exception:
             logger.exception("JoinButton callback failed")
             try:
@@ -270,7 +677,7 @@ class ParticipantsView(discord.ui.View):
         self.add_item(self.join_button)
 
     # CORRECT signature: (self, interaction, button)
-    @discord.ui.button(label="View Participants", style=discord.ButtonStyle.primary, emoji="📋")
+    @discord.ui.button(label="View Participants", style=discord.ButtonStyle.primary, emoji="📋", custom_id="giveaway:participants")
     async def view_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         try:
             gw = bot.giveaways.get(self.message_id)
@@ -279,7 +686,7 @@ class ParticipantsView(discord.ui.View):
                 return
 
             # participants only from button-joins (we intentionally removed reaction joins)
-            participants_set: Set[int] = set(gw.get("participants", set()))
+            participants_set: Dict[int, None] = gw.get("participants") or {}
 
             if not participants_set:
                 await interaction.response.send_message("No participants yet.", ephemeral=True)
@@ -288,21 +695,15 @@ class ParticipantsView(discord.ui.View):
             # Build participants options and entries map (first 25)
             options = []
             participants_map: Dict[int, int] = {}
-            gw_extra = gw.get("extra_roles", {}) or {}
-            i = 0
             # limit to first 25 to fit select
-            for uid in list(participants_set):
-                if i >= 25:
-                    break
+            for uid in islice(participants_set, 25):
                 # try to get Member object (guild-only)
                 member = interaction.guild.get_member(uid) if interaction.guild else None
-                # calculate entries using roles
-                entries = calculate_entries_for_member(member, gw_extra) if member else 1
+                entries = cached_entries(gw, member) if member else 1
                 participants_map[uid] = entries
                 label = (member.display_name if member else f"User {str(uid)}")[:100]
                 desc = f"{entries} entry" if entries == 1 else f"{entries} entries"
                 options.append(discord.SelectOption(label=label, description=desc, value=str(uid)))
-                i += 1
 
             select = ParticipantsSelect(options=options, participants_map=participants_map)
             view = discord.ui.View(timeout=120)
@@ -361,24 +762,20 @@ async def giveaway_start(
     host = host or interaction.user
     gw_extra = parse_extra_entries_string(extra_entries)
 
-    ends_at = datetime.utcnow() + timedelta(seconds=seconds)
-    rel_ends = discord.utils.format_dt(ends_at, style="R")
+    # epoch seconds: cheap to compare/sort and stored as-is in SQLite
+    ends_at = int(time.time()) + seconds
+    rel_ends = discord.utils.format_dt(datetime.fromtimestamp(ends_at, timezone.utc), style="R")
 
     embed = discord.Embed(
         title="🎉 Giveaway Started!",
         description=f"**Prize:** {prize}\n**Ends:** {rel_ends}\n**Winners:** {winners}\nPress **Join Giveaway** to enter.",
         color=discord.Color.gold(),
-        timestamp=datetime.utcnow()
+        timestamp=discord.utils.utcnow()
     )
     embed.add_field(name="Host", value=f"{getattr(host, 'mention', str(host))}", inline=True)
     embed.add_field(name="Required Role", value=(required_role.mention if required_role else "None"), inline=True)
     # show extra entries summary if provided or global bonuses exist
-    extras_text = "None"
-    merged_extras = dict(BONUS_ROLES)
-    merged_extras.update(gw_extra)
-    if merged_extras:
-        extras_text = "\n".join(f"<@&{rid}>: +{bonus}" for rid, bonus in merged_extras.items())
-    embed.add_field(name="Extra Entries", value=extras_text, inline=False)
+    embed.add_field(name="Extra Entries", value=extra_entries_field_text(gw_extra), inline=False)
     embed.add_field(name="Community", value=f"[Join our Roblox group]({ROBLOX_GROUP_URL})", inline=False)
     embed.set_footer(text=FOOTER_TEXT)
 
@@ -416,54 +813,77 @@ async def giveaway_start(
         "host_id": getattr(host, "id", None),
         "required_role_id": required_role.id if required_role else None,
         "extra_roles": gw_extra,  # per-giveaway extra entries
+        "bonuses": merge_bonuses(gw_extra),  # BONUS_ROLES + extra_roles, read by entry calculations
         "winners": int(winners),
         "ends_at": ends_at,
-        "participants": set(),  # user ids from JoinButton
-        "ended": False,
-        "task": None
+        "participants": {},  # user ids from JoinButton, in join order (values unused)
+        "message": gw_msg,  # cached so end/reroll skip a fetch_message round-trip
+        "ended": False
     }
 
-    # schedule auto-end
-    async def _auto_end(mid: int, chan_id: int, wait_s: int):
+    # persist so the giveaway survives restarts; giveaway_poller ends it when due
+    try:
+        async with bot.pool.connection() as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO giveaways (message_id, channel_id, host_id, prize, winners, ends_at, ended, extra_roles_json, required_role_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?)",
+                (gw_msg.id, channel.id, getattr(host, "id", None), prize, int(winners), ends_at,
+                 json.dumps(gw_extra), required_role.id if required_role else None)
+            )
+    except Exception:
+        # still ends on time from memory (giveaway_poller), but won't survive a restart
+        logger.exception("Failed to persist giveaway %s", gw_msg.id)
         try:
-            await asyncio.sleep(wait_s)
-            chan = bot.get_channel(chan_id) or await bot.fetch_channel(chan_id)
-            if chan:
-                await end_giveaway(chan, mid)
-        except asyncio.CancelledError:
-            return
-        except Exception:
-            logger.exception("Auto-end failed for giveaway %s", mid)
+            await interaction.followup.send("⚠️ Giveaway is live but couldn't be saved; it won't survive a bot restart.", ephemeral=True)
+        except discord.HTTPException:
+            logger.exception("Failed to warn host about unsaved giveaway")
 
-    task = asyncio.create_task(_auto_end(gw_msg.id, channel.id, seconds))
-    bot.giveaways[gw_msg.id]["task"] = task
+async def mark_giveaway_ended(message_id: int):
+    gw = bot.giveaways.get(message_id)
+    if gw:
+        gw["ended"] = True
+    try:
+        async with bot.pool.connection() as db:
+            await db.execute("UPDATE giveaways SET ended = 1 WHERE message_id = ?", (message_id,))
+    except Exception:
+        logger.exception("Failed to mark giveaway %s ended", message_id)
 
 async def end_giveaway(channel: discord.TextChannel, message_id: int):
     gw = bot.giveaways.get(message_id)
     if not gw or gw.get("ended"):
+        await mark_giveaway_ended(message_id)
         return
 
+    # stop pending label edits so they can't re-attach the view after we remove it
+    label_task = gw.pop("_label_task", None)
+    if label_task:
+        label_task.cancel()
+
     try:
-        msg = await channel.fetch_message(message_id)
+        msg = gw.get("message") or await channel.fetch_message(message_id)
+    except discord.NotFound:
+        logger.warning("Giveaway message %s was deleted; closing it", message_id)
+        await mark_giveaway_ended(message_id)
+        return
     except Exception:
+        # transient failure: leave it open so giveaway_poller (or /giveaway end) can retry
         logger.exception("Failed to fetch giveaway message %s", message_id)
-        gw["ended"] = True
         return
 
     # participants: only button-based participants (no reactions)
-    participants_ids: Set[int] = set(gw.get("participants", set()))
+    participants_ids: Dict[int, None] = gw.get("participants") or {}
+    await resolve_missing_members(channel.guild, participants_ids)
 
     # filter required role & compute entries
     eligible_list = []
-    gw_extra = gw.get("extra_roles", {}) or {}
+    req_id = gw.get("required_role_id")
     for uid in participants_ids:
         m = channel.guild.get_member(uid)
         if not m:
             continue
-        req_id = gw.get("required_role_id")
-        if req_id and not discord.utils.get(m.roles, id=req_id):
+        if req_id and not member_has_role(m, req_id):
             continue
-        eligible_list.append((uid, calculate_entries_for_member(m, gw_extra)))
+        eligible_list.append((uid, cached_entries(gw, m)))
 
     if not eligible_list:
         # edit original message to indicate ended with no winners
@@ -475,27 +895,14 @@ async def end_giveaway(channel: discord.TextChannel, message_id: int):
             await msg.edit(embed=embed, view=None)
         except Exception:
             logger.exception("Failed to edit giveaway message after end (no eligible).")
-        gw["ended"] = True
+        await mark_giveaway_ended(message_id)
         return
 
-    # build weighted pool
-    pool = []
-    for uid, entries in eligible_list:
-        pool.extend([uid] * entries)
+    # weighted draw without replacement
+    winners_ids = pick_weighted_winners(eligible_list, gw["winners"])
 
-    winners_count = min(gw["winners"], len(set(pool)))
-    winners_ids = []
-    for _ in range(winners_count):
-        pick = random.choice(pool)
-        winners_ids.append(pick)
-        pool = [x for x in pool if x != pick]
-        if not pool:
-            break
-
-    mentions = []
-    for uid in winners_ids:
-        member = channel.guild.get_member(uid)
-        mentions.append(member.mention if member else f"<@{uid}>")
+    # a raw <@id> renders as a mention for any user, no member lookup needed
+    mentions = [f"<@{uid}>" for uid in winners_ids]
 
     # EDIT the original giveaway message embed to show winners and remove buttons
     embed = msg.embeds[0] if msg.embeds else discord.Embed()
@@ -508,13 +915,7 @@ async def end_giveaway(channel: discord.TextChannel, message_id: int):
     except Exception:
         logger.exception("Failed to edit giveaway message after end (winners).")
 
-    # cancel auto-task
-    if t := gw.get("task"):
-        try:
-            t.cancel()
-        except Exception:
-            pass
-    gw["ended"] = True
+    await mark_giveaway_ended(message_id)
 
 @giveaway_group.command(name="end", description="End a giveaway early (host role required)")
 @app_commands.describe(message_id="Message ID of the giveaway message")
@@ -567,60 +968,73 @@ async def giveaway_reroll(interaction: discord.Interaction, message_id: str):
         return
 
     try:
-        msg = await chan.fetch_message(mid)
+        msg = gw.get("message") or await chan.fetch_message(mid)
     except Exception:
         await interaction.response.send_message("❌ Couldn't fetch the giveaway message.", ephemeral=True)
         return
 
+    # acknowledge before resolving members: the gateway queries can outlast the 3s window
+    await interaction.response.defer()
+
     # participants: only button-based participants (no reactions)
-    participants_ids: Set[int] = set(gw.get("participants", set()))
+    participants_ids: Dict[int, None] = gw.get("participants") or {}
+    await resolve_missing_members(chan.guild, participants_ids)
 
-    gw_extra = gw.get("extra_roles", {}) or {}
     eligible_list = []
+    req_id = gw.get("required_role_id")
     for uid in participants_ids:
         m = chan.guild.get_member(uid)
         if not m:
             continue
-        req_id = gw.get("required_role_id")
-        if req_id and not discord.utils.get(m.roles, id=req_id):
+        if req_id and not member_has_role(m, req_id):
             continue
-        eligible_list.append((uid, calculate_entries_for_member(m, gw_extra)))
+        eligible_list.append((uid, cached_entries(gw, m)))
 
     if not eligible_list:
-        await interaction.response.send_message("❌ No eligible entries to reroll.", ephemeral=True)
+        await interaction.followup.send("❌ No eligible entries to reroll.")
         return
 
-    pool = []
-    for uid, entries in eligible_list:
-        pool.extend([uid] * entries)
+    winners_ids = pick_weighted_winners(eligible_list, gw["winners"])
 
-    winners_count = min(gw["winners"], len(set(pool)))
-    winners_ids = []
-    for _ in range(winners_count):
-        pick = random.choice(pool)
-        winners_ids.append(pick)
-        pool = [x for x in pool if x != pick]
-        if not pool:
-            break
+    mentions = [f"<@{uid}>" for uid in winners_ids]
 
-    mentions = []
-    for uid in winners_ids:
-        m = chan.guild.get_member(uid)
-        mentions.append(m.mention if m else f"<@{uid}>")
+    await interaction.followup.send(f"🔄 New winner(s): {', '.join(mentions)}")
 
-    await interaction.response.send_message(f"🔄 New winner(s): {', '.join(mentions)}", ephemeral=False)
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    # only role changes affect entries; drop the cached value so it's recomputed on next read
+    if before._roles == after._roles:
+        return
+    for gw in bot.giveaways.values():
+        entries_map = gw.get("entries")
+        if entries_map:
+            entries_map.pop(after.id, None)
 
 # -------------------------
 # Other commands (profile, report, suggest, help)
 # -------------------------
 ROBLOX_USERS = "https://users.roblox.com/v1/usernames/users"
+ROBLOX_CACHE_TTL = 600
+ROBLOX_CACHE_MAX = 512
 
 async def roblox_get_user(session: aiohttp.ClientSession, username: str) -> Optional[dict]:
+    key = username.lower()
+    cached = bot._roblox_cache.get(key)
+    if cached and time.monotonic() - cached[0] < ROBLOX_CACHE_TTL:
+        bot._roblox_cache.move_to_end(key)
+        return cached[1]
     try:
-        async with session.post(ROBLOX_USERS, json={"usernames": [username], "excludeBannedUsers": False}) as resp:
-            data = await resp.json()
+        body = orjson.dumps({"usernames": [username], "excludeBannedUsers": False})
+        async with bot._roblox_sem, session.post(ROBLOX_USERS, data=body, headers={"Content-Type": "application/json"}) as resp:
+            data = orjson.loads(await resp.read())
             if data.get("data"):
-                return data["data"][0]
+                user = data["data"][0]
+                bot._roblox_cache[key] = (time.monotonic(), user)
+                bot._roblox_cache.move_to_end(key)
+                if len(bot._roblox_cache) > ROBLOX_CACHE_MAX:
+                    # evict the least recently used name
+                    bot._roblox_cache.popitem(last=False)
+                return user
     except Exception:
         logger.exception("Roblox lookup failed")
     return None
@@ -650,40 +1064,34 @@ async def profile(interaction: discord.Interaction, username: str):
     embed.add_field(name="User ID", value=str(user_id), inline=True)
     embed.add_field(name="Community", value=f"[Join our Roblox group]({ROBLOX_GROUP_URL})", inline=False)
     embed.set_footer(text=FOOTER_TEXT)
-    embed.timestamp = datetime.utcnow()
+    embed.timestamp = discord.utils.utcnow()
     await interaction.followup.send(embed=embed)
 
 @bot.tree.command(name="report", description="Send a bug report to the bot owner")
 @app_commands.describe(bug="Describe the bug")
 async def report(interaction: discord.Interaction, bug: str):
-    embed = discord.Embed(title="🐞 Bug Report", description=bug, color=discord.Color.red(), timestamp=datetime.utcnow())
+    embed = discord.Embed(title="🐞 Bug Report", description=bug, color=discord.Color.red(), timestamp=discord.utils.utcnow())
     embed.set_author(name=str(interaction.user), icon_url=interaction.user.display_avatar.url)
     embed.add_field(name="Community", value=f"[Join our Roblox group]({ROBLOX_GROUP_URL})", inline=False)
     embed.set_footer(text=FOOTER_TEXT)
     await interaction.response.send_message("✅ Your bug report was sent!", ephemeral=True)
-    await bot.db.execute("INSERT INTO reports (user_id, username, content) VALUES (?, ?, ?)", (interaction.user.id, str(interaction.user), bug))
-    await bot.db.commit()
+    bot.write_queue.put_nowait(("reports", (interaction.user.id, str(interaction.user), bug)))
     try:
-        owner = await bot.fetch_user(OWNER_ID)
-        if owner:
-            await owner.send(embed=embed)
+        await bot.dm_owner(embed)
     except Exception:
         logger.exception("Failed to DM owner")
 
 @bot.tree.command(name="suggest", description="Send a suggestion to the bot owner")
 @app_commands.describe(idea="Your suggestion")
 async def suggest(interaction: discord.Interaction, idea: str):
-    embed = discord.Embed(title="💡 Suggestion", description=idea, color=discord.Color.green(), timestamp=datetime.utcnow())
+    embed = discord.Embed(title="💡 Suggestion", description=idea, color=discord.Color.green(), timestamp=discord.utils.utcnow())
     embed.set_author(name=str(interaction.user), icon_url=interaction.user.display_avatar.url)
     embed.add_field(name="Community", value=f"[Join our Roblox group]({ROBLOX_GROUP_URL})", inline=False)
     embed.set_footer(text=FOOTER_TEXT)
     await interaction.response.send_message("✅ Your suggestion was sent!", ephemeral=True)
-    await bot.db.execute("INSERT INTO suggestions (user_id, username, content) VALUES (?, ?, ?)", (interaction.user.id, str(interaction.user), idea))
-    await bot.db.commit()
+    bot.write_queue.put_nowait(("suggestions", (interaction.user.id, str(interaction.user), idea)))
     try:
-        owner = await bot.fetch_user(OWNER_ID)
-        if owner:
-            await owner.send(embed=embed)
+        await bot.dm_owner(embed)
     except Exception:
         logger.exception("Failed to DM owner")
 
@@ -696,7 +1104,7 @@ async def help_command(interaction: discord.Interaction):
             "`/giveaway start duration:1h winners:2 prize:\"Nitro\" channel:#giveaways host:@You required_role:@Members extra_entries:123:2,456:5`"
         ),
         color=discord.Color.blurple(),
-        timestamp=datetime.utcnow()
+        timestamp=discord.utils.utcnow()
     )
     embed.add_field(name="🎉 /giveaway", value="start • end • reroll (host role required)", inline=False)
     embed.add_field(name="🕹️ /profile", value="View a Roblox user's profile", inline=False)
@@ -711,28 +1119,79 @@ async def help_command(interaction: discord.Interaction):
 # -------------------------
 # match first sequence of digits anywhere
 NUMBER_RE = re.compile(r"(?<!\d)(\d+)(?!\d)")
+# a count has to start within this many characters; long pastes aren't scanned past it
+NUMBER_SCAN_LIMIT = 64
+RECENT_MSG_IDS_MAX = 4096
 
-async def _set_pending_prompt(channel_id: int, prompt_num: int, msg_id: int):
-    # store pending prompt in memory (short-lived)
-    bot.pending_prompts[channel_id] = {"prompt_num": prompt_num, "msg_id": msg_id, "ts": datetime.utcnow()}
+# set in on_ready; lets on_message test raw mention ids without resolving User objects
+BOT_USER_ID: Optional[int] = None
 
-async def _clear_pending_prompt_if_outdated(channel_id: int):
-    p = bot.pending_prompts.get(channel_id)
-    if not p:
-        return
-    # clear if older than 5 minutes (safety)
-    if (datetime.utcnow() - p["ts"]).total_seconds() > 300:
-        bot.pending_prompts.pop(channel_id, None)
+async def _set_pending_prompt(channel_id: int, prompt_num: int, msg_id: int):
+    # store pending prompt in memory (replaced or popped when the counter moves)
+    bot.pending_prompts[channel_id] = {"prompt_num": prompt_num, "msg_id": msg_id}
 
-@bot.event
-async def on_message(message: discord.Message):
-    if message.author.bot:
+async def _rehydrate_pending_prompts():
+    """
+    After a restart, recover each counting channel's outstanding bot prompt from
+    its last few messages so on_message never has to scan history itself
+    """
+    for cid in COUNTING_CHANNEL_IDS:
+        if cid in bot.pending_prompts:
+            continue
+        channel = bot.get_channel(cid)
+        if channel is None:
+            continue
+        expected = bot.last_number.get(cid, 0) + 1
+        try:
+            async for hist_msg in channel.history(limit=5):
+                if hist_msg.author.id != BOT_USER_ID:
+                    continue
+                m = NUMBER_RE.match(hist_msg.content or "")
+                if m and int(m.group(1)) == expected:
+                    bot.pending_prompts[cid] = {"prompt_num": expected, "msg_id": hist_msg.id}
+                break
+        except discord.HTTPException as e:
+            logger.warning("Failed to rehydrate pending prompt for channel %s: %s", cid, e)
+
+async def _notify_fumble(message: discord.Message):
+    """
+    ❌ reaction, failure message and failure role for a fumbled count, sent concurrently
+    """
+    calls = [
+        message.add_reaction(CROSS_EMOJI),
+        message.channel.send(f"❌ {message.author.mention} fumbled the count! Start again at **1**."),
+    ]
+    # add failure role if configured (skip the REST call for repeat offenders)
+    already_failed = isinstance(message.author, discord.Member) and member_has_role(message.author, FAILURE_ROLE_ID)
+    role = message.guild.get_role(FAILURE_ROLE_ID) if message.guild and not already_failed else None
+    if role:
+        calls.append(message.author.add_roles(role, reason="Failed counting game"))
+    for res in await asyncio.gather(*calls, return_exceptions=True):
+        if isinstance(res, Exception):
+            logger.warning("Failed to send fumble notification: %s", res)
+
+async def _handle_counting(message: discord.Message):
+    """
+    Counting game for one message in a counting channel (commands are only processed
+    when the message has no number or the counting logic itself fails)
+    """
+    # a replayed/duplicate event must not be counted twice
+    if message.id in bot.recent_msg_ids:
         return
-
-    # Counting channel logic
-    if message.channel.id in COUNTING_CHANNEL_IDS:
-        # find the first integer in the message (if any)
-        m = NUMBER_RE.search(message.content or "")
+    bot.recent_msg_ids[message.id] = None
+    if len(bot.recent_msg_ids) > RECENT_MSG_IDS_MAX:
+        bot.recent_msg_ids.popitem(last=False)
+
+    content = (message.content or "").strip()
+    if content.isascii() and content.isdigit() and len(content) <= 18:
+        # fast path: the whole message is the number
+        number = int(content)
+    else:
+        # find the first integer near the start of the message (if any)
+        m = NUMBER_RE.search(content, 0, NUMBER_SCAN_LIMIT)
+        if m and m.end() == NUMBER_SCAN_LIMIT:
+            # the number runs past the window; re-match it in full
+            m = NUMBER_RE.match(content, m.start())
         if not m:
             # no number, let normal commands run
             await bot.process_commands(message)
@@ -745,141 +1204,104 @@ async def on_message(message: discord.Message):
             await bot.process_commands(message)
             return
 
-        # easter egg: if number is 67, reply to the user's message with the gif
+    # easter egg: if number is 67, reply to the user's message with the gif
+    if number == 67:
         try:
-            if number == 67:
-                try:
-                    await message.reply(EASTER_EGG_67_GIF)
-                except Exception:
-                    logger.exception("Failed to send 67 easter-egg reply")
-        except Exception:
-            logger.exception("Easter egg handling failed")
-
-        # ensure we have a lock for this channel (guard creation)
-        async with bot._locks_registry_lock:
-            if message.channel.id not in bot.count_locks:
-                bot.count_locks[message.channel.id] = asyncio.Lock()
-            lock = bot.count_locks[message.channel.id]
-
-        # critical section per-channel
-        async with lock:
-            try:
-                # cleanup outdated pending prompt
-                await _clear_pending_prompt_if_outdated(message.channel.id)
-
-                # start an immediate transaction to lock row for this channel
-                await bot.db.execute("BEGIN IMMEDIATE")
-                # ensure row exists
-                await bot.db.execute("INSERT OR IGNORE INTO counting (channel_id, last_number) VALUES (?, ?)", (message.channel.id, 0))
-                # read last_number
-                async with bot.db.execute("SELECT last_number FROM counting WHERE channel_id = ?", (message.channel.id,)) as cur:
-                    row = await cur.fetchone()
-                    last = int(row["last_number"]) if row and "last_number" in row.keys() else (row[0] if row else 0)
-
-                logger.debug("Channel %s last_number=%s incoming=%s", message.channel.id, last, number)
-
-                accepted = False
-
-                # Case 1: exact next number
-                if number == last + 1:
+            await message.reply(EASTER_EGG_67_GIF)
+        except discord.HTTPException as e:
+            logger.warning("Failed to send 67 easter-egg reply: %s", e)
+
+    # no await between lookup and insert, so this can't race on the event loop
+    lock = bot.count_locks.get(message.channel.id)
+    if lock is None:
+        lock = bot.count_locks[message.channel.id] = asyncio.Lock()
+
+    # critical section per-channel
+    fumbled = False
+    async with lock:
+        try:
+            # read last_number from the in-memory state (flushed to SQLite by counting_flusher)
+            last = bot.last_number.get(message.channel.id, 0)
+            # single lookup, reused for the skip-over check and the post-accept clear
+            # (no age limit: a prompt for last+1 stays valid however quiet the channel gets)
+            pend = bot.pending_prompts.get(message.channel.id)
+
+            logger.debug("Channel %s last_number=%s incoming=%s", message.channel.id, last, number)
+
+            accepted = False
+
+            # Case 1: exact next number
+            if number == last + 1:
+                accepted = True
+            else:
+                # Case 2: user skipped bot prompt: user posted last+2 while bot already posted last+1 as a prompt.
+                # (pending_prompts is rehydrated from history once in on_ready, so no API scan here)
+                if number == last + 2 and pend and pend.get("prompt_num") == last + 1:
                     accepted = True
+
+            if accepted:
+                # valid count: move the counter to the user's number
+                bot.last_number[message.channel.id] = number
+                bot._counting_dirty.add(message.channel.id)
+
+                # clear pending prompt if we've moved past it
+                if pend and number >= pend.get("prompt_num", 0):
+                    bot.pending_prompts.pop(message.channel.id, None)
+
+                # react to the user's message and send the next-number prompt concurrently
+                # (the prompt is NOT written into DB)
+                next_num = number + 1
+                react_res, bot_msg = await asyncio.gather(
+                    message.add_reaction(CHECK_EMOJI),
+                    # ✅ goes in the content instead of a second add_reaction call
+                    message.channel.send(f"{next_num} ✅"),
+                    return_exceptions=True
+                )
+                if isinstance(react_res, Exception):
+                    logger.warning("Failed to react ✅: %s", react_res)
+                if isinstance(bot_msg, Exception):
+                    logger.warning("Failed to send next number prompt: %s", bot_msg)
                 else:
-                    # Case 2: user skipped bot prompt: user posted last+2 while bot already posted last+1 as a prompt.
-                    # Check in-memory pending prompt first:
-                    pend = bot.pending_prompts.get(message.channel.id)
-                    if number == last + 2 and pend and pend.get("prompt_num") == last + 1:
-                        accepted = True
-                    else:
-                        # fallback: check if a recent bot message with content == last+1 exists (scan last 10 messages)
-                        if number == last + 2:
-                            try:
-                                async for hist_msg in message.channel.history(limit=10, after=None):
-                                    if hist_msg.author == bot.user:
-                                        # normalize content to digits only (strip non-digits)
-                                        txt = (hist_msg.content or "").strip()
-                                        # match single int content or content that starts with number
-                                        m2 = NUMBER_RE.search(txt)
-                                        if m2:
-                                            try:
-                                                val = int(m2.group(1))
-                                            except Exception:
-                                                continue
-                                            if val == last + 1:
-                                                accepted = True
-                                                break
-                            except Exception:
-                                logger.exception("Failed to scan history for bot prompt fallback")
-
-                if accepted:
-                    # valid count: update DB to the user's number
-                    await bot.db.execute("UPDATE counting SET last_number = ? WHERE channel_id = ?", (number, message.channel.id))
-                    await bot.db.commit()
-
-                    # react to the user's message as confirmation
+                    # record pending prompt in-memory
                     try:
-                        await message.add_reaction("✅")
+                        await _set_pending_prompt(message.channel.id, next_num - 0, bot_msg.id)
                     except Exception:
-                        logger.exception("Failed to react ✅")
+                        logger.exception("Failed to set pending prompt")
+            else:
+                # incorrect number -> fumble: reset to 0
+                bot.last_number[message.channel.id] = 0
+                bot._counting_dirty.add(message.channel.id)
+                # notifications are sent after the lock is released
+                fumbled = True
+        except Exception:
+            logger.exception("Counting logic failed")
+            # let commands run to avoid dead path
+            await bot.process_commands(message)
+            return
 
-                    # clear pending prompt if we've moved past it
-                    pend = bot.pending_prompts.get(message.channel.id)
-                    if pend and number >= pend.get("prompt_num", 0):
-                        bot.pending_prompts.pop(message.channel.id, None)
+    if fumbled:
+        await _notify_fumble(message)
 
-                    # send a bot prompt for the next number (do NOT write that into DB)
-                    next_num = number + 1
-                    try:
-                        bot_msg = await message.channel.send(str(next_num))
-                        try:
-                            await bot_msg.add_reaction("✅")
-                        except Exception:
-                            logger.exception("Failed to react to bot prompt")
-                        # record pending prompt in-memory
-                        try:
-                            await _set_pending_prompt(message.channel.id, next_num - 0, bot_msg.id)
-                        except Exception:
-                            logger.exception("Failed to set pending prompt")
-                    except Exception:
-                        logger.exception("Failed to send next number prompt")
-                else:
-                    # incorrect number -> fumble: reset to 0
-                    try:
-                        await message.add_reaction("❌")
-                    except Exception:
-                        logger.exception("Failed to react ❌")
-                    await bot.db.execute("UPDATE counting SET last_number = 0 WHERE channel_id = ?", (message.channel.id,))
-                    await bot.db.commit()
-                    try:
-                        await message.channel.send(f"❌ {message.author.mention} fumbled the count! Start again at **1**.")
-                    except Exception:
-                        logger.exception("Failed to send failure msg")
-                    # add failure role if configured
-                    role = message.guild.get_role(FAILURE_ROLE_ID) if message.guild else None
-                    if role:
-                        try:
-                            await message.author.add_roles(role, reason="Failed counting game")
-                        except Exception:
-                            logger.exception("Failed to add failure role")
-            except Exception:
-                logger.exception("Counting logic failed (in transaction)")
-                try:
-                    await bot.db.rollback()
-                except Exception:
-                    logger.exception("Rollback failed")
-                # let commands run to avoid dead path
-                await bot.process_commands(message)
-                return
+# channel id -> handler; channels not listed take the mention/commands path in on_message
+CHANNEL_HANDLERS: Dict[int, Callable[[discord.Message], Awaitable[None]]] = {cid: _handle_counting for cid in COUNTING_CHANNEL_IDS}
 
-        # we handled counting; do not process commands again
+@bot.event
+async def on_message(message: discord.Message):
+    if message.author.bot:
+        return
+
+    handler = CHANNEL_HANDLERS.get(message.channel.id)
+    if handler:
+        await handler(message)
         return
 
     # react if bot mentioned
-    if bot.user in message.mentions:
-        try:
-            for emoji in ["🇾", "🇪", "🇸", "❓"]:
-                await message.add_reaction(emoji)
-        except Exception:
-            logger.exception("Failed to react to mention")
+    if BOT_USER_ID in message.raw_mentions:
+        # fire all four reactions concurrently instead of one round-trip each
+        results = await asyncio.gather(*(message.add_reaction(e) for e in MENTION_EMOJIS), return_exceptions=True)
+        for r in results:
+            if isinstance(r, Exception):
+                logger.warning("Failed to react to mention: %s", r)
 
     # allow other commands to run
     await bot.process_commands(message)
@@ -889,9 +1311,26 @@ async def on_message(message: discord.Message):
 # -------------------------
 @bot.event
 async def on_ready():
+    global BOT_USER_ID
+    BOT_USER_ID = bot.user.id
     logger.info(f"Logged in as {bot.user} ({bot.user.id})")
+    await _rehydrate_pending_prompts()
+    # warm the member cache once so giveaway draws don't miss entrants
+    for g in bot.guilds:
+        if not g.chunked:
+            try:
+                await g.chunk(cache=True)
+            except Exception:
+                logger.exception("Failed to chunk guild %s", g.id)
 
 if __name__ == "__main__":
+    # libuv event loop when available (not supported on Windows)
+    if sys.platform != "win32":
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        except ImportError:
+            logger.info("uvloop not installed; using the default asyncio loop")
     try:
         bot.run(TOKEN)
     except discord.errors.PrivilegedIntentsRequired: